@@ -6,11 +6,49 @@ Most endpoints require authentication via Frappe session or OAuth token.
 The `get_oauth_config` endpoint allows guest access for retrieving site-specific OAuth settings.
 """
 
+import base64
 import frappe
-import os
 from frappe import _
-from frappe.utils import today, getdate, nowdate, cint, strip_html, add_days
+from frappe.model import default_fields
+from frappe.query_builder import Order
+from frappe.query_builder.functions import Count
+from frappe.utils import today, getdate, get_datetime, nowdate, cint, strip_html, add_days
 from frappe.desk.form.assign_to import add as assign_task, remove as unassign_task
+from pypika import Criterion
+from pypika import analytics as an
+from pypika.functions import Coalesce, NullIf, Substring
+
+# Redis hash of host -> get_oauth_config response, cleared when Mobile OAuth Settings change
+OAUTH_CONFIG_CACHE_KEY = "mobile_oauth_config"
+
+# Columns for task list rows. description is left to get_task, and title is
+# projected separately with a description fallback (see filter_tasks).
+# assigned_to stays because it is the fallback when a task has no ToDo.
+LIST_FIELDS = ["name", "status", "priority", "start_date", "due_date", "assigned_to", "modified"]
+
+# Columns for the task detail screen (get_task)
+DETAIL_FIELDS = LIST_FIELDS + [
+	"title", "description", "task_type", "lead", "project", "unit", "project_unit",
+	"reference_doctype", "reference_docname"
+]
+
+# (site, doctype) pairs known to exist; only positive answers are cached so a
+# doctype added by a later migrate is picked up without a worker restart
+_EXISTING_DOCTYPES = set()
+
+# (site, domains, host_name) -> frozenset of allowed hosts, see _get_allowed_domains
+_ALLOWED_HOSTS_CACHE = {}
+
+
+def _doctype_exists(doctype):
+	"""Return True if the DocType exists on the current site, cached per worker once found."""
+	key = (frappe.local.site, doctype)
+	if key in _EXISTING_DOCTYPES:
+		return True
+	if frappe.db.exists("DocType", doctype):
+		_EXISTING_DOCTYPES.add(key)
+		return True
+	return False
 
 
 def _safe_fields(dt, want):
@@ -18,11 +56,31 @@ def _safe_fields(dt, want):
 	Return only fields that exist on the given doctype.
 	Prevents KeyErrors when querying fields that don't exist.
 	"""
+	# get_meta is cached in Redis and invalidated site-wide on schema changes,
+	# and has_field is a dict lookup, so no extra cache is needed here
 	meta = frappe.get_meta(dt)
-	have = {f.fieldname for f in meta.fields}
 	# standard meta fields we may use:
-	have |= {"name", "modified"}
-	return [f for f in want if f in have]
+	return [f for f in want if f in ("name", "modified") or meta.has_field(f)]
+
+
+def _apply_order_by(query, doctype, order_by):
+	"""
+	Apply a "field [asc|desc], ..." order_by string to a query builder query.
+	Only real columns of the doctype are accepted, so user input never reaches raw SQL.
+	"""
+	table = frappe.qb.DocType(doctype)
+	meta = frappe.get_meta(doctype)
+	for part in (order_by or "").split(","):
+		tokens = part.split()
+		if not tokens:
+			continue
+		field = tokens[0].strip("`")
+		direction = tokens[1].lower() if len(tokens) > 1 else "asc"
+		valid_field = field in default_fields or meta.has_field(field)
+		if not valid_field or direction not in ("asc", "desc") or len(tokens) > 2:
+			frappe.throw(_("Invalid order_by: {0}").format(order_by))
+		query = query.orderby(table[field], order=Order.desc if direction == "desc" else Order.asc)
+	return query
 
 
 def _get_assigned_users(doctype, docname):
@@ -62,43 +120,106 @@ def _get_assigned_users(doctype, docname):
 	
 	# If no users found in ToDo, check the assigned_to field directly
 	# Only if docname is not None
-	if not user_emails and docname:
-		try:
-			task_doc = frappe.get_doc(doctype, docname)
-			if hasattr(task_doc, "assigned_to") and task_doc.assigned_to:
-				user_emails.add(task_doc.assigned_to)
-		except Exception:
-			# If document doesn't exist or error occurs, skip
-			pass
+	if not user_emails and docname and frappe.get_meta(doctype).has_field("assigned_to"):
+		assigned_to = frappe.db.get_value(doctype, docname, "assigned_to")
+		if assigned_to:
+			user_emails.add(assigned_to)
+	
+	if not user_emails:
+		return assigned_users
+	
+	# Get user details for all assigned users in a single query
+	users = frappe.get_all(
+		"User",
+		filters={"name": ("in", list(user_emails))},
+		fields=["name", "email", "full_name", "user_image"]
+	)
+	users_by_name = {user.name: user for user in users}
 	
-	# Get user details for each assigned user
 	for email in user_emails:
-		try:
-			user = frappe.get_doc("User", email)
-			user_data = {
-				"email": user.email or email,
-				"name": user.full_name or user.name,
-			}
-			
-			# Get profile picture if available
-			if hasattr(user, "user_image") and user.user_image:
-				user_data["profile_pic"] = user.user_image
-			elif hasattr(user, "photo") and user.photo:
-				user_data["profile_pic"] = user.photo
-			else:
-				user_data["profile_pic"] = None
-			
-			assigned_users.append(user_data)
-		except frappe.DoesNotExistError:
+		user = users_by_name.get(email)
+		if not user:
 			# User doesn't exist, skip
 			continue
-		except Exception:
-			# Error fetching user, skip
-			continue
+		assigned_users.append({
+			"email": user.email or email,
+			"name": user.full_name or user.name,
+			"profile_pic": user.user_image or None
+		})
 	
 	return assigned_users
 
 
+def _get_assigned_users_bulk(doctype, docnames, fallback=None):
+	"""
+	Get assigned users for many documents at once.
+	Issues one ToDo query and one User query regardless of how many documents are passed.
+	
+	Args:
+		doctype: Document type (e.g., "CRM Task")
+		docnames: List of document names/IDs
+		fallback: Optional dict of docname -> assigned_to field value, used for
+			documents that have no open ToDo assignments
+		
+	Returns:
+		Dict of docname -> list of user objects with email, name, and profile_pic
+	"""
+	docnames = [d for d in docnames if d]
+	assigned_map = {d: [] for d in docnames}
+	if not docnames:
+		return assigned_map
+	
+	# Get assigned users for all documents from ToDo table
+	todos = frappe.get_all(
+		"ToDo",
+		filters={
+			"reference_type": doctype,
+			"reference_name": ("in", docnames),
+			"status": "Open"
+		},
+		fields=["reference_name", "allocated_to"],
+		distinct=True
+	)
+	
+	# Group unique user emails per document, keeping first-seen order
+	emails_by_doc = {d: [] for d in docnames}
+	for todo in todos:
+		email = todo.get("allocated_to")
+		if email and email not in emails_by_doc[todo.reference_name]:
+			emails_by_doc[todo.reference_name].append(email)
+	
+	# Fall back to the assigned_to field for documents without ToDo assignments
+	for docname, emails in emails_by_doc.items():
+		if not emails and fallback and fallback.get(docname):
+			emails.append(fallback[docname])
+	
+	user_emails = {email for emails in emails_by_doc.values() for email in emails}
+	if not user_emails:
+		return assigned_map
+	
+	# Get user details for the union of all assigned users in a single query
+	users = frappe.get_all(
+		"User",
+		filters={"name": ("in", list(user_emails))},
+		fields=["name", "email", "full_name", "user_image"]
+	)
+	users_by_name = {user.name: user for user in users}
+	
+	for docname, emails in emails_by_doc.items():
+		for email in emails:
+			user = users_by_name.get(email)
+			if not user:
+				# User doesn't exist, skip
+				continue
+			assigned_map[docname].append({
+				"email": user.email or email,
+				"name": user.full_name or user.name,
+				"profile_pic": user.user_image or None
+			})
+	
+	return assigned_map
+
+
 def _ensure_user_from_mobile_data(email=None, name=None, profile_pic=None, user_id=None):
 	"""
 	Ensure a user exists from mobile app data.
@@ -137,11 +258,12 @@ def _ensure_user_from_mobile_data(email=None, name=None, profile_pic=None, user_
 		
 		if updated:
 			user.save(ignore_permissions=True)
-			frappe.db.commit()
 		
 		return email
 	else:
-		# Create new user (if permissions allow)
+		# Create new user (if permissions allow). No commit here: callers commit
+		# with their own writes, so a savepoint undoes a half-done insert instead
+		frappe.db.savepoint("mobile_user_insert")
 		try:
 			user = frappe.new_doc("User")
 			user.email = email
@@ -157,15 +279,48 @@ def _ensure_user_from_mobile_data(email=None, name=None, profile_pic=None, user_
 					user.photo = profile_pic
 			
 			user.insert(ignore_permissions=True)
-			frappe.db.commit()
 			return email
 		except Exception as e:
+			frappe.db.rollback(save_point="mobile_user_insert")
 			frappe.log_error(f"Failed to create user {email}: {str(e)}", "User Creation Error")
 			# Return email anyway - assignment will fail gracefully if user doesn't exist
 			return email
 
 
-def get_compact_task(task, return_all_fields=False):
+def _compact_from_dict(task, assigned_map=None):
+	"""
+	Compact task representation for rows returned by list queries.
+	Same output as get_compact_task(task) but assumes a dict row, skipping the
+	Document/dict probing done per field.
+	
+	Args:
+		task: Task row (frappe._dict)
+		assigned_map: Optional dict of task name -> assigned users, as returned by
+			_get_assigned_users_bulk
+	"""
+	name = task["name"]
+	if assigned_map is None:
+		assigned_map = _get_assigned_users_bulk("CRM Task", [name], fallback={name: task.get("assigned_to")})
+	
+	description = task.get("description")
+	result = {
+		"name": name,
+		"title": task.get("title") or (description[:50] if description else ""),
+		"status": task.get("status"),
+		"priority": task.get("priority"),
+		"start_date": task.get("start_date"),
+		"modified": task.get("modified")
+	}
+	
+	due_date = task.get("due_date")
+	if due_date is not None:
+		result["due_date"] = due_date
+	
+	result["assigned_to"] = assigned_map.get(name) or []
+	return result
+
+
+def get_compact_task(task, return_all_fields=False, assigned_map=None):
 	"""
 	Return task representation.
 	Accepts both Document objects and dict-like objects (frappe._dict).
@@ -173,6 +328,8 @@ def get_compact_task(task, return_all_fields=False):
 	Args:
 		task: Task document or dict
 		return_all_fields: If True, return all available fields from task object
+		assigned_map: Optional dict of task name -> assigned users, as returned by
+			_get_assigned_users_bulk. When supplied, no assignment queries are issued.
 	"""
 	# Handle both dict-like and Document objects
 	def _get(obj, key, default=None):
@@ -244,23 +401,29 @@ def get_compact_task(task, return_all_fields=False):
 	
 	# Get assigned users with full details (always override assigned_to field)
 	try:
-		assigned_users = _get_assigned_users("CRM Task", task_name)
+		if assigned_map is not None:
+			# Prefetched by the caller; the assigned_to fallback is already applied
+			assigned_users = assigned_map.get(task_name) or []
+		else:
+			assigned_users = _get_assigned_users("CRM Task", task_name)
 		if assigned_users:
 			result["assigned_to"] = assigned_users
 		else:
 			# Fallback: check if assigned_to field exists (single user)
-			assigned_to = _get(task, "assigned_to")
+			assigned_to = _get(task, "assigned_to") if assigned_map is None else None
 			if assigned_to:
 				# Try to get user details for single assigned user
-				try:
-					user = frappe.get_doc("User", assigned_to)
+				user = frappe.db.get_value(
+					"User", assigned_to, ["email", "full_name", "name", "user_image"], as_dict=True
+				)
+				if user:
 					result["assigned_to"] = [{
 						"email": user.email or assigned_to,
 						"name": user.full_name or user.name,
-						"profile_pic": getattr(user, "user_image", None) or getattr(user, "photo", None) or None
+						"profile_pic": user.user_image or None
 					}]
-				except Exception:
-					# If user doesn't exist or error, return empty array
+				else:
+					# If user doesn't exist, return empty array
 					result["assigned_to"] = []
 			else:
 				result["assigned_to"] = []
@@ -328,6 +491,40 @@ def get_compact_task(task, return_all_fields=False):
 	return result
 
 
+def _get_allowed_domains(site_name):
+	"""
+	Return the normalized domains configured for the site as a frozenset.
+	
+	The set is built once per worker for each distinct `domains`/`host_name`
+	configuration, so editing site_config.json takes effect without a restart.
+	"""
+	site_config = frappe.local.conf or {}
+	domains = site_config.get("domains")
+	host_name = site_config.get("host_name")
+	
+	cache_key = (site_name, repr(domains), repr(host_name))
+	cached = _ALLOWED_HOSTS_CACHE.get(cache_key)
+	if cached is not None:
+		return cached
+	
+	allowed_domains = set()
+	
+	# Get domains list if available
+	if domains:
+		if isinstance(domains, list):
+			allowed_domains.update(d.lower().strip() for d in domains)
+		elif isinstance(domains, str):
+			# Comma-separated or space-separated
+			allowed_domains.update(d.lower().strip() for d in domains.replace(",", " ").split())
+	
+	# Get host_name if available
+	if host_name:
+		allowed_domains.add(host_name.lower().strip())
+	
+	_ALLOWED_HOSTS_CACHE[cache_key] = frozenset(allowed_domains)
+	return _ALLOWED_HOSTS_CACHE[cache_key]
+
+
 def _validate_host():
 	"""
 	Validate that the request Host header belongs to the current site's configured domains.
@@ -335,7 +532,7 @@ def _validate_host():
 	This prevents returning client_id for external domains that don't belong to the site.
 	
 	Returns:
-		None (raises ValidationError if host is not allowed)
+		Normalized request host (raises ValidationError if host is not allowed)
 	
 	Raises:
 		frappe.exceptions.ValidationError: If host is not in site's allowed domains
@@ -386,24 +583,8 @@ def _validate_host():
 		))
 	
 	# Get allowed domains from site config
-	allowed_domains = []
 	try:
-		site_config = frappe.get_site_config()
-		
-		# Get domains list if available
-		if "domains" in site_config and site_config["domains"]:
-			if isinstance(site_config["domains"], list):
-				allowed_domains.extend([d.lower().strip() for d in site_config["domains"]])
-			elif isinstance(site_config["domains"], str):
-				# Comma-separated or space-separated
-				domains_str = site_config["domains"]
-				allowed_domains.extend([d.lower().strip() for d in domains_str.replace(",", " ").split()])
-		
-		# Get host_name if available
-		if "host_name" in site_config and site_config["host_name"]:
-			host_name = site_config["host_name"].lower().strip()
-			if host_name not in allowed_domains:
-				allowed_domains.append(host_name)
+		allowed_domains = _get_allowed_domains(site_name)
 		
 		# SECURITY: If no domains configured, use site_name ONLY if it matches host
 		# This is a minimal fallback for sites without explicit domain config
@@ -412,7 +593,7 @@ def _validate_host():
 			site_name_lower = site_name.lower().strip()
 			# Only allow if host exactly matches site_name (exact match required)
 			if host == site_name_lower:
-				allowed_domains.append(site_name_lower)
+				allowed_domains = {site_name_lower}
 			else:
 				# Host doesn't match site_name and no domains configured - DENY
 				frappe.log_error(
@@ -428,7 +609,7 @@ def _validate_host():
 		site_name_lower = site_name.lower().strip() if site_name else None
 		if site_name_lower and host == site_name_lower:
 			# Exact match - allow as minimal fallback
-			allowed_domains = [site_name_lower]
+			allowed_domains = {site_name_lower}
 		else:
 			# No match or no site_name - DENY
 			frappe.log_error(
@@ -441,7 +622,7 @@ def _validate_host():
 	
 	# Allow localhost and 127.0.0.1 ONLY if explicitly in allowed_domains
 	# Do NOT allow them automatically - this is a security risk
-	development_hosts = ["localhost", "127.0.0.1"]
+	development_hosts = {"localhost", "127.0.0.1"}
 	
 	# Check if host is allowed
 	host_allowed = False
@@ -461,6 +642,8 @@ def _validate_host():
 			"Access denied: The domain '{host}' is not configured for this site. "
 			"Please use a valid domain for site '{site_name}'."
 		).format(host=host, site_name=site_name))
+	
+	return host
 
 
 def _ensure_mobile_oauth_settings():
@@ -487,53 +670,25 @@ def _ensure_mobile_oauth_settings():
 			"Site information is not available. Please ensure you are accessing a valid Frappe site."
 		))
 	
-	# Check if the site exists in the bench by verifying site directory exists
-	# This prevents creating OAuth clients for domains that route to non-existent sites
-	# Get bench path from frappe local
-	if hasattr(frappe.local, 'site_path') and frappe.local.site_path:
-		# site_path is typically: /path/to/bench/sites/site_name
-		bench_path = os.path.dirname(os.path.dirname(frappe.local.site_path))
-		site_path = frappe.local.site_path
-		
-		if not os.path.exists(site_path):
-			frappe.log_error(
-				f"Site '{site_name}' does not exist in Frappe bench. "
-				f"Site directory not found at: {site_path}. "
-				f"Requested domain may not be configured.",
-				"OAuth Auto-Config Error"
-			)
-			frappe.throw(_(
-				"Site '{site_name}' is not configured in this Frappe bench. "
-				"Please contact system administrator or use a valid site domain."
-			).format(site_name=site_name))
+	# No need to check the site directory here: Frappe only routes requests to
+	# sites that exist in the bench, so it is validated before we get here
 	
-	# Additional check: verify database connection is valid
-	# This helps catch cases where domain routing is wrong
-	try:
-		if not hasattr(frappe.conf, 'db_name') or not frappe.conf.db_name:
-			frappe.log_error(
-				f"Site '{site_name}' database configuration is missing.",
-				"OAuth Auto-Config Error"
-			)
-			frappe.throw(_(
-				"Site '{site_name}' is not properly configured. "
-				"Database configuration is missing. Please contact system administrator."
-			).format(site_name=site_name))
-		
-		# Test database connection
-		frappe.db.sql("SELECT 1", as_dict=True)
-	except Exception as db_error:
+	# Additional check: verify database configuration is present
+	# This helps catch cases where domain routing is wrong. The connection itself
+	# is exercised by loading the settings below; a failure there is reported by
+	# get_oauth_config.
+	if not hasattr(frappe.conf, 'db_name') or not frappe.conf.db_name:
 		frappe.log_error(
-			f"Database connection failed for site '{site_name}': {str(db_error)}",
+			f"Site '{site_name}' database configuration is missing.",
 			"OAuth Auto-Config Error"
 		)
 		frappe.throw(_(
 			"Site '{site_name}' is not properly configured. "
-			"Database connection failed. Please contact system administrator."
+			"Database configuration is missing. Please contact system administrator."
 		).format(site_name=site_name))
 	
 	# First check if the DocType exists in the database
-	if not frappe.db.exists("DocType", "Mobile OAuth Settings"):
+	if not _doctype_exists("Mobile OAuth Settings"):
 		frappe.log_error(
 			f"Mobile OAuth Settings DocType not found on site '{site_name}'. "
 			f"Please run 'bench --site {site_name} migrate' to create it.",
@@ -554,15 +709,33 @@ def _ensure_mobile_oauth_settings():
 			"name": "Mobile OAuth Settings"
 		})
 		settings.insert(ignore_permissions=True)
-		frappe.db.commit()
 	
 	# If client_id is already set, return settings
 	if settings.client_id:
 		return settings
 	
+	# client_id is empty: only one worker may create the OAuth Client. The others
+	# wait for the lock, then pick up its result instead of creating a duplicate
+	with frappe.cache().lock(frappe.cache().make_key("mobile_oauth_setup"), timeout=10):
+		# Start a new transaction so settings committed by the lock holder are visible
+		frappe.db.commit()
+		settings = frappe.get_single("Mobile OAuth Settings")
+		if settings.client_id:
+			return settings
+		return _create_mobile_oauth_client(settings)
+
+
+def _create_mobile_oauth_client(settings):
+	"""
+	Create the mobile app OAuth Client and store it on Mobile OAuth Settings.
+	Must be called while holding the mobile_oauth_setup lock.
+	
+	Returns:
+		Updated Mobile OAuth Settings document
+	"""
 	# client_id is empty, need to create OAuth Client
 	# Check if OAuth Provider is available
-	if not frappe.db.exists("DocType", "OAuth Client"):
+	if not _doctype_exists("OAuth Client"):
 		frappe.log_error(
 			"OAuth Provider not installed. Please install frappe.integrations.oauth2_provider",
 			"OAuth Auto-Config Error"
@@ -603,13 +776,15 @@ def _ensure_mobile_oauth_settings():
 	
 	# Insert the OAuth Client (client_id and client_secret are auto-generated)
 	client_doc.insert(ignore_permissions=True)
-	frappe.db.commit()
 	
 	# Update Mobile OAuth Settings with the OAuth Client info
 	settings.client_id = client_doc.client_id
 	settings.scope = client_doc.scopes or "all openid"
 	settings.redirect_uri = client_doc.default_redirect_uri or redirect_uri
 	settings.save(ignore_permissions=True)
+	
+	# Guest GET requests are not committed by Frappe, so persist the new
+	# settings and OAuth Client explicitly (once, after all writes)
 	frappe.db.commit()
 	
 	return settings
@@ -640,7 +815,12 @@ def get_oauth_config():
 	"""
 	# Step 1: Validate Host header (deny by default if not in allowed domains)
 	# This MUST be the first check - no client_id should be returned if host is invalid
-	_validate_host()
+	host = _validate_host()
+	
+	# Serve from cache once the host is known to be allowed
+	cached = frappe.cache().hget(OAUTH_CONFIG_CACHE_KEY, host)
+	if cached:
+		return cached
 	
 	# Step 2: Ensure OAuth settings exist and are configured
 	# This will create OAuth Client automatically if needed (idempotent)
@@ -667,72 +847,21 @@ def get_oauth_config():
 		)
 		frappe.throw(_("OAuth configuration is incomplete. Please contact system administrator."))
 	
-	return {
+	config = {
 		"client_id": settings.client_id,
 		"scope": settings.scope or "all openid",
 		"redirect_uri": settings.redirect_uri or "app.trust://oauth2redirect"
 	}
+	frappe.cache().hset(OAUTH_CONFIG_CACHE_KEY, host, config)
+	return config
 
 
-@frappe.whitelist(allow_guest=True)
-def test_host_validation(test_host=None, expected_result=None):
-	"""
-	Test function to verify Host validation.
-	For testing purposes only - should be removed in production.
-	
-	Args:
-		test_host: Host to test (default: "facebook.com")
-		expected_result: "allow" or "reject" (default: "reject")
-	"""
-	# Mock request with test host
-	class MockRequest:
-		def __init__(self, host):
-			self.headers = {"Host": host}
-	
-	original_request = getattr(frappe.local, 'request', None)
-	test_host = test_host or "facebook.com"
-	expected_result = expected_result or "reject"
-	
-	try:
-		frappe.local.request = MockRequest(test_host)
-		_validate_host()
-		# Validation passed (host was allowed)
-		if expected_result == "allow":
-			return {
-				"status": "PASSED",
-				"message": f"Host '{test_host}' was ALLOWED as expected"
-			}
-		else:
-			return {
-				"status": "FAILED",
-				"message": f"Host '{test_host}' was ALLOWED but should be REJECTED!"
-			}
-	except frappe.exceptions.ValidationError as e:
-		# Validation failed (host was rejected)
-		if expected_result == "reject":
-			return {
-				"status": "PASSED",
-				"message": f"Host '{test_host}' was REJECTED as expected",
-				"error": str(e)[:200]
-			}
-		else:
-			return {
-				"status": "FAILED",
-				"message": f"Host '{test_host}' was REJECTED but should be ALLOWED!",
-				"error": str(e)[:200]
-			}
-	except Exception as e:
-		return {
-			"status": "ERROR",
-			"message": f"Unexpected error: {type(e).__name__}",
-			"error": str(e)[:200]
-		}
-	finally:
-		if original_request:
-			frappe.local.request = original_request
+def clear_oauth_config_cache():
+	"""Drop cached get_oauth_config responses for all hosts of the current site."""
+	frappe.cache().delete_value(OAUTH_CONFIG_CACHE_KEY)
 
 
-@frappe.whitelist()
+@frappe.whitelist(methods=["POST"])
 def create_task(title=None, status=None, priority=None, start_date=None, 
 				task_type=None, description=None, assigned_to=None, due_date=None,
 				reference_doctype=None, reference_docname=None,
@@ -921,7 +1050,6 @@ def create_task(title=None, status=None, priority=None, start_date=None,
 						})
 	
 	task.insert()
-	frappe.db.commit()
 	
 	# Handle assigned_to_list (multiple users via Frappe's assign_to system)
 	users_to_assign = []
@@ -968,13 +1096,11 @@ def create_task(title=None, status=None, priority=None, start_date=None,
 		except Exception as e:
 			frappe.log_error(f"Failed to assign task {task.name} to {user_email}: {str(e)}", "Task Assignment Error")
 	
-	frappe.db.commit()
-	
 	# Return full task with all fields
 	return get_compact_task(task, return_all_fields=True)
 
 
-@frappe.whitelist()
+@frappe.whitelist(methods=["POST"])
 def edit_task(task_id=None, name=None, title=None, status=None, priority=None, start_date=None,
 			  task_type=None, description=None, assigned_to=None, due_date=None,
 			  reference_doctype=None, reference_docname=None,
@@ -1122,7 +1248,6 @@ def edit_task(task_id=None, name=None, title=None, status=None, priority=None, s
 						})
 	
 	task.save()
-	frappe.db.commit()
 	
 	# Handle assigned_to_list (multiple users via Frappe's assign_to system)
 	users_to_assign = []
@@ -1194,8 +1319,6 @@ def edit_task(task_id=None, name=None, title=None, status=None, priority=None, s
 			except Exception as e:
 				frappe.log_error(f"Failed to assign task {task.name} to {user_email}: {str(e)}", "Task Assignment Error")
 	
-	frappe.db.commit()
-	
 	# Return full task with all fields
 	return get_compact_task(task, return_all_fields=True)
 
@@ -1222,7 +1345,7 @@ def update_task(task_id=None, name=None, title=None, status=None, priority=None,
 	)
 
 
-@frappe.whitelist()
+@frappe.whitelist(methods=["POST"])
 def delete_task(task_id=None, name=None):
 	"""
 	Delete a CRM Task.
@@ -1243,12 +1366,11 @@ def delete_task(task_id=None, name=None):
 	
 	# Delete task (this respects permissions)
 	frappe.delete_doc("CRM Task", name)
-	frappe.db.commit()
 	
 	return {"ok": True, "message": f"Task {name} deleted successfully"}
 
 
-@frappe.whitelist()
+@frappe.whitelist(methods=["POST"])
 def update_status(task_id=None, name=None, status=None):
 	"""
 	Update task status.
@@ -1273,16 +1395,62 @@ def update_status(task_id=None, name=None, status=None):
 	task = frappe.get_doc("CRM Task", name)
 	task.status = status
 	task.save()
-	frappe.db.commit()
 	
 	return get_compact_task(task)
 
 
+def _encode_task_cursor(task):
+	"""Encode a task's (modified, name) sort key as an opaque keyset cursor."""
+	raw = f"{task.modified}|{task.name}"
+	return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_task_cursor(cursor):
+	"""Decode a keyset cursor into its (modified, name) sort key."""
+	try:
+		raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+		modified, name = raw.split("|", 1)
+		return get_datetime(modified), name
+	except Exception:
+		frappe.throw(_("Invalid cursor"))
+
+
+@frappe.whitelist()
+def get_task(task_id=None, name=None):
+	"""
+	Get a single CRM Task for the detail screen.
+	List endpoints leave out description; this returns it along with the other
+	detail fields and link names.
+	
+	Args:
+		task_id: Task ID (name) - required (can also use 'name')
+		name: Task name (alias for task_id)
+	
+	Returns:
+		Task JSON with detail fields
+	"""
+	# Accept either task_id or name
+	task_name = task_id or name
+	if not task_name:
+		frappe.throw(_("Task ID is required"))
+	
+	task = frappe.db.get_value("CRM Task", task_name, _safe_fields("CRM Task", DETAIL_FIELDS), as_dict=True)
+	# Missing and not-permitted give the same error, so callers can't probe task names
+	if not task or not frappe.has_permission("CRM Task", "read", task_name):
+		frappe.throw(_("Task {0} not found").format(task_name), frappe.DoesNotExistError)
+	
+	return get_compact_task(task, return_all_fields=True)
+
+
 @frappe.whitelist()
 def filter_tasks(date_from=None, date_to=None, importance=None, status=None,
-				 limit=20, page=1, order_by="modified desc"):
+				 limit=20, page=1, order_by="modified desc", cursor=None):
 	"""
-	Filter and search CRM Tasks with page-based pagination.
+	Filter and search CRM Tasks with cursor (keyset) or page-based pagination.
+	
+	Cursor pagination is preferred: pass the `next_cursor` of the previous response
+	as `cursor` to get the next page. Its cost does not grow with page depth, unlike
+	`page`, which makes the database skip (page - 1) * limit rows.
 	
 	Args:
 		date_from: Start date filter (YYYY-MM-DD)
@@ -1290,8 +1458,10 @@ def filter_tasks(date_from=None, date_to=None, importance=None, status=None,
 		importance: Comma-separated priority values (e.g., "High,Medium")
 		status: Comma-separated status values (e.g., "Todo,In Progress")
 		limit: Page size - maximum results per page (default: 20)
-		page: Page number (1-based, default: 1)
-		order_by: Sort order (default: "modified desc")
+		page: Page number (1-based, default: 1). Ignored when cursor is given.
+		order_by: Sort order (default: "modified desc"). Cursor pagination always
+			sorts by "modified desc, name desc".
+		cursor: Opaque cursor from a previous response's next_cursor
 	
 	Returns:
 		{
@@ -1299,8 +1469,9 @@ def filter_tasks(date_from=None, date_to=None, importance=None, status=None,
 				"data": [tasks...],
 				"page": current_page,
 				"page_size": limit,
-				"total": total_matching_tasks,
-				"has_next": boolean
+				"total": total_matching_tasks (same on every page, cursor or not),
+				"has_next": boolean,
+				"next_cursor": str or None
 			}
 		}
 	"""
@@ -1310,49 +1481,100 @@ def filter_tasks(date_from=None, date_to=None, importance=None, status=None,
 	if page < 1:
 		page = 1
 	
+	# Keyset pagination needs a total order, so modified is tie-broken by name
+	keyset = bool(cursor) or (order_by or "").strip().lower() == "modified desc"
+	if keyset:
+		order_by = "modified desc, name desc"
+	if cursor:
+		page = 1
+	
 	# Compute offset from page number
 	start = (page - 1) * limit
 	
+	Task = frappe.qb.DocType("CRM Task")
+	
 	# Build filters as a list of conditions
-	filters = []
+	conditions = []
 	if date_from:
-		filters.append(["start_date", ">=", date_from])
+		conditions.append(Task.start_date >= date_from)
 	if date_to:
-		filters.append(["start_date", "<=", date_to])
+		conditions.append(Task.start_date <= date_to)
 	
 	if importance:
 		priorities = [p.strip() for p in importance.split(",") if p.strip()]
 		if priorities:
-			filters.append(["priority", "in", priorities])
+			conditions.append(Task.priority.isin(priorities))
 	
 	if status:
 		statuses = [s.strip() for s in status.split(",") if s.strip()]
 		if statuses:
-			filters.append(["status", "in", statuses])
+			conditions.append(Task.status.isin(statuses))
+	
+	# Filters without the keyset predicate, for the cursor page's total
+	filter_conditions = list(conditions)
+	if cursor:
+		after_modified, after_name = _decode_task_cursor(cursor)
+		conditions.append(
+			(Task.modified < after_modified)
+			| ((Task.modified == after_modified) & (Task.name < after_name))
+		)
 	
 	# Get safe fields for CRM Task
-	base_fields = ["name", "title", "status", "priority", "start_date", "due_date", 
-	               "assigned_to", "modified", "description"]
-	fields = _safe_fields("CRM Task", base_fields)
+	fields = _safe_fields("CRM Task", LIST_FIELDS)
+	
+	# Title falls back to the first 50 characters of the description; doing it in
+	# SQL keeps the description TEXT column off the wire
+	title = Coalesce(NullIf(Task.title, ""), Substring(Task.description, 1, 50)).as_("title")
+	
+	query = frappe.qb.from_(Task).select(*[Task[f] for f in fields], title)
+	
+	if cursor:
+		# Keyset page: no window count, which would read every row after the cursor.
+		# One extra row tells us whether there is a next page, so the
+		# ORDER BY modified, name ... LIMIT can stop early on the (modified, name) index
+		query = query.where(Criterion.all(conditions)).limit(limit + 1)
+		query = _apply_order_by(query, "CRM Task", order_by)
+		tasks = query.run(as_dict=True)
+		has_next = len(tasks) > limit
+		tasks = tasks[:limit]
+		
+		# total always counts every matching task, not just those after the cursor
+		total = frappe.qb.from_(Task).select(Count("*")).where(Criterion.all(filter_conditions)).run()[0][0]
+	else:
+		# Get tasks with pagination; the total is computed in the same query
+		# with a window function instead of a second COUNT(*) over the same filters
+		query = (
+			query.select(an.Count(Task.name).over().as_("_total"))
+			.where(Criterion.all(conditions))
+			.limit(limit)
+			.offset(start)
+		)
+		query = _apply_order_by(query, "CRM Task", order_by)
+		tasks = query.run(as_dict=True)
+		
+		# Get total count of matching tasks
+		if tasks:
+			total = tasks[0]._total
+		elif start:
+			# Page is past the end, so the window count is unavailable
+			total = frappe.qb.from_(Task).select(Count("*")).where(Criterion.all(conditions)).run()[0][0]
+		else:
+			total = 0
+		
+		# Calculate if there are more pages
+		has_next = (start + len(tasks)) < total
 	
-	# Get tasks with pagination
-	tasks = frappe.get_all(
+	# Prefetch assignees for the whole page (2 queries instead of 2 per task)
+	assigned_map = _get_assigned_users_bulk(
 		"CRM Task",
-		filters=filters,
-		fields=fields,
-		order_by=order_by,
-		limit_start=start,
-		limit_page_length=limit
+		[task.name for task in tasks],
+		fallback={task.name: task.get("assigned_to") for task in tasks}
 	)
 	
-	# Get total count of matching tasks
-	total = frappe.db.count("CRM Task", filters=filters)
-	
 	# Format tasks using compact helper
-	data = [get_compact_task(task) for task in tasks]
+	data = [_compact_from_dict(task, assigned_map) for task in tasks]
 	
-	# Calculate if there are more pages
-	has_next = (start + len(data)) < total
+	next_cursor = _encode_task_cursor(tasks[-1]) if keyset and has_next else None
 	
 	return {
 		"message": {
@@ -1360,7 +1582,8 @@ def filter_tasks(date_from=None, date_to=None, importance=None, status=None,
 			"page": page,
 			"page_size": limit,
 			"total": total,
-			"has_next": has_next
+			"has_next": has_next,
+			"next_cursor": next_cursor
 		}
 	}
 
@@ -1631,33 +1854,75 @@ def home_tasks(limit=5):
 	# Get task names first (lightweight query)
 	# NOTE: Using start_date (not due_date) to filter today's tasks
 	# start_date is Datetime field, so we need to use range filter
-	task_names = frappe.get_all(
-		"CRM Task",
-		filters=[
-			["start_date", ">=", f"{today_date} 00:00:00"],
-			["start_date", "<", f"{tomorrow_date} 00:00:00"]
-		],
-		fields=["name"],
-		order_by="priority desc, modified desc",
-		page_length=cint(limit) or 5
+	# Query builder with an explicit column list keeps the emitted SQL free of
+	# get_all's meta/permission handling, so the start_date index is usable
+	Task = frappe.qb.DocType("CRM Task")
+	task_names = (
+		frappe.qb.from_(Task)
+		.select(Task.name)
+		.where(Task.start_date >= f"{today_date} 00:00:00")
+		.where(Task.start_date < f"{tomorrow_date} 00:00:00")
+		.orderby(Task.priority, order=Order.desc)
+		.orderby(Task.modified, order=Order.desc)
+		.limit(cint(limit) or 5)
+		.run(as_dict=True)
 	)
 	
 	# Get full task documents with all fields
-	data = []
+	task_docs = []
 	for task_name_obj in task_names:
 		try:
-			task_doc = frappe.get_doc("CRM Task", task_name_obj.name)
-			data.append(get_compact_task(task_doc, return_all_fields=True))
+			task_docs.append(frappe.get_doc("CRM Task", task_name_obj.name))
 		except Exception:
 			# Skip tasks that can't be loaded (permissions, deleted, etc.)
 			continue
 	
+	# Prefetch assignees for all tasks at once
+	assigned_map = _get_assigned_users_bulk(
+		"CRM Task",
+		[task_doc.name for task_doc in task_docs],
+		fallback={task_doc.name: task_doc.get("assigned_to") for task_doc in task_docs}
+	)
+	data = [
+		get_compact_task(task_doc, return_all_fields=True, assigned_map=assigned_map)
+		for task_doc in task_docs
+	]
+	
 	return {
 		"today": data,
 		"limit": cint(limit) or 5
 	}
 
 
+# Per-bucket (field, descending) sort keys, matching the ORDER BY of each
+# branch in main_page_buckets
+MAIN_PAGE_BUCKET_ORDER = {
+	"today": [("priority", True), ("modified", True)],
+	"late": [("start_date", False), ("priority", True)],
+	"upcoming": [("start_date", False), ("priority", True)],
+}
+
+
+def _sort_like_sql(rows, order):
+	"""
+	Sort rows in place the way MariaDB orders them: strings case-insensitively,
+	NULLs first when ascending and last when descending.
+	
+	Args:
+		rows: List of dict rows
+		order: List of (fieldname, descending) pairs, most significant first
+	"""
+	# Stable sorts from the least significant key up give the combined order
+	for field, descending in reversed(order):
+		rows.sort(
+			key=lambda r: (
+				r.get(field) is not None,
+				r[field].lower() if isinstance(r.get(field), str) else (r.get(field) or 0),
+			),
+			reverse=descending,
+		)
+
+
 @frappe.whitelist()
 def main_page_buckets(min_each=5):
 	"""
@@ -1683,53 +1948,75 @@ def main_page_buckets(min_each=5):
 	# Active statuses (not Done or Canceled)
 	active_statuses = ["Backlog", "Todo", "In Progress"]
 	
-	def get_tasks_with_all_fields(filters, order_by, page_length):
-		"""Helper to get task names first, then load full documents."""
-		task_names = frappe.get_all(
-			"CRM Task",
-			filters=filters,
-			fields=["name"],
-			order_by=order_by,
-			page_length=page_length
-		)
-		
-		tasks = []
-		for task_name_obj in task_names:
+	# Get the names for all three buckets in one round-trip. Each branch keeps its
+	# own ORDER BY/LIMIT; UNION ALL doesn't promise to keep that order, so the sort
+	# columns come back too and each bucket's few rows are re-sorted in Python.
+	# start_date is Datetime field, so today uses a range filter (not due_date)
+	rows = frappe.db.sql(
+		"""
+		(SELECT `name`, 'today' AS bucket, `priority`, `modified`, `start_date`
+		FROM `tabCRM Task`
+		WHERE `start_date` >= %(today)s AND `start_date` < %(tomorrow)s
+		ORDER BY `priority` DESC, `modified` DESC
+		LIMIT %(limit)s)
+		UNION ALL
+		(SELECT `name`, 'late' AS bucket, `priority`, `modified`, `start_date`
+		FROM `tabCRM Task`
+		WHERE `start_date` < %(today)s AND `status` IN %(active_statuses)s
+		ORDER BY `start_date` ASC, `priority` DESC
+		LIMIT %(limit)s)
+		UNION ALL
+		(SELECT `name`, 'upcoming' AS bucket, `priority`, `modified`, `start_date`
+		FROM `tabCRM Task`
+		WHERE `start_date` >= %(tomorrow)s
+		ORDER BY `start_date` ASC, `priority` DESC
+		LIMIT %(limit)s)
+		""",
+		{
+			"today": f"{today_date} 00:00:00",
+			"tomorrow": f"{tomorrow_date} 00:00:00",
+			"active_statuses": tuple(active_statuses),
+			"limit": min_count,
+		},
+		as_dict=True
+	)
+	
+	bucket_rows = {"today": [], "late": [], "upcoming": []}
+	for row in rows:
+		bucket_rows[row.bucket].append(row)
+	
+	# Load full documents per bucket, in each bucket's order
+	bucket_docs = {}
+	for bucket, rows_in_bucket in bucket_rows.items():
+		_sort_like_sql(rows_in_bucket, MAIN_PAGE_BUCKET_ORDER[bucket])
+		bucket_docs[bucket] = []
+		for row in rows_in_bucket:
 			try:
-				task_doc = frappe.get_doc("CRM Task", task_name_obj.name)
-				tasks.append(get_compact_task(task_doc, return_all_fields=True))
+				bucket_docs[bucket].append(frappe.get_doc("CRM Task", row.name))
 			except Exception:
 				# Skip tasks that can't be loaded (permissions, deleted, etc.)
 				continue
-		return tasks
+	today_docs = bucket_docs["today"]
+	late_docs = bucket_docs["late"]
+	upcoming_docs = bucket_docs["upcoming"]
 	
-	# Today's tasks - using start_date (not due_date)
-	# start_date is Datetime field, so we need to use range filter
-	today_tasks = get_tasks_with_all_fields(
-		filters=[
-			["start_date", ">=", f"{today_date} 00:00:00"],
-			["start_date", "<", f"{tomorrow_date} 00:00:00"]
-		],
-		order_by="priority desc, modified desc",
-		page_length=min_count
+	# Prefetch assignees for all three buckets at once
+	all_docs = today_docs + late_docs + upcoming_docs
+	assigned_map = _get_assigned_users_bulk(
+		"CRM Task",
+		[task_doc.name for task_doc in all_docs],
+		fallback={task_doc.name: task_doc.get("assigned_to") for task_doc in all_docs}
 	)
 	
-	# Late tasks (before today and still active) - using start_date (not due_date)
-	late_tasks = get_tasks_with_all_fields(
-		filters=[
-			["start_date", "<", f"{today_date} 00:00:00"],
-			["status", "in", active_statuses]
-		],
-		order_by="start_date asc, priority desc",
-		page_length=min_count
-	)
+	def compact(task_docs):
+		return [
+			get_compact_task(task_doc, return_all_fields=True, assigned_map=assigned_map)
+			for task_doc in task_docs
+		]
 	
-	# Upcoming tasks (after today) - using start_date (not due_date)
-	upcoming_tasks = get_tasks_with_all_fields(
-		filters=[["start_date", ">=", f"{tomorrow_date} 00:00:00"]],
-		order_by="start_date asc, priority desc",
-		page_length=min_count
-	)
+	today_tasks = compact(today_docs)
+	late_tasks = compact(late_docs)
+	upcoming_tasks = compact(upcoming_docs)
 	
 	return {
 		"today": today_tasks,
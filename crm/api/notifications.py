@@ -1,18 +1,45 @@
+import functools
+import operator
+import re
+
 import frappe
 from frappe.query_builder import Order
+from frappe.utils import cint, now
 from typing import Dict, Any, List, Optional
 
 # ----------------------------- Helpers -----------------------------
 
 CRM_DTYPES = {"CRM Lead": "lead", "CRM Deal": "deal"}
 CRM_ROUTE = {"CRM Lead": "Lead", "CRM Deal": "Deal"}
+_TAG_RE = re.compile(r"<[^>]+>")
+_REMINDER_TYPES = frozenset({"reminder", "alert"})
+_REMIND_RE = re.compile(r"remind", re.IGNORECASE)
+_REMOVED_RE = re.compile(r"has been removed by")
+
+
+# الـ schema مش بتتغير غير مع migrate، فبنحفظ نتايج الفحص في Redis (مشتركة بين كل
+# الـ workers بتوع الـ site) وبنمسحها في after_migrate (clear_schema_cache).
+# نتيجة الفحص بتتحفظ بس لو نجح؛ أي خطأ في الداتابيز ما بيتخزنش.
+_SCHEMA_CACHE_KEY = "crm:notification_schema"
+
+
+def _schema_flag(field: str, probe) -> bool:
+    cache = frappe.cache()
+    value = cache.hget(_SCHEMA_CACHE_KEY, field)
+    if value is None:
+        value = bool(probe())
+        cache.hset(_SCHEMA_CACHE_KEY, field, value)
+    return value
 
 
 def _has(col: str) -> bool:
     """هل عمود موجود في Notification Log؟"""
     try:
-        return frappe.db.has_column("Notification Log", col)
+        return _schema_flag(
+            f"column:{col}", lambda: frappe.db.has_column("Notification Log", col)
+        )
     except Exception:
+        # خطأ مؤقت: نرجّع False للطلب ده بس من غير ما نحفظه
         return False
 
 
@@ -25,6 +52,18 @@ def _seen_column_name() -> Optional[str]:
     return None
 
 
+def _has_crm_notification_table() -> bool:
+    """هل جدول CRM Notification (legacy) موجود؟"""
+    return _schema_flag(
+        "table:CRM Notification", lambda: frappe.db.table_exists("CRM Notification")
+    )
+
+
+def clear_schema_cache():
+    """after_migrate: يمسح نتايج فحص الأعمدة/الجداول المحفوظة لكل الـ workers."""
+    frappe.cache().delete_value(_SCHEMA_CACHE_KEY)
+
+
 def _bool_seen(row: Dict[str, Any], seen_col: Optional[str]) -> bool:
     if not seen_col:
         return False
@@ -35,14 +74,36 @@ def _text_from_nlog(row: Dict[str, Any]) -> str:
     txt = (row.get("subject") or "").strip()
     if not txt:
         txt = (row.get("email_content") or "").strip()
-    return frappe.utils.strip_html(txt) or "Notification"
+    # أغلب الـ subjects نص عادي، فمش محتاجين regex غير لو فيه tag
+    if "<" in txt:
+        txt = _TAG_RE.sub("", txt).strip()
+    return txt or "Notification"
 
 
 def _looks_like_reminder(row: Dict[str, Any]) -> bool:
     """تعريف مرن للـ Reminder: لو النوع Reminder/Alert أو العنوان فيه remind"""
-    t = (row.get("type") or "").lower()
-    subj = (row.get("subject") or "").lower()
-    return t in {"reminder", "alert"} or ("remind" in subj)
+    return _is_reminder(row.get("type"), row.get("subject"))
+
+
+def _is_reminder(ntype: Optional[str], subject: Optional[str]) -> bool:
+    # النوع الأول (أرخص)، والـ regex على العنوان بس لو النوع مش reminder
+    return (ntype or "").lower() in _REMINDER_TYPES or bool(
+        subject and _REMIND_RE.search(subject)
+    )
+
+
+def _full_names(users) -> Dict[str, Optional[str]]:
+    """يجيب full_name لمجموعة مستخدمين في query واحدة بدل query لكل صف."""
+    users = [u for u in set(users) if u]
+    if not users:
+        return {}
+    rows = frappe.get_all(
+        "User",
+        filters={"name": ("in", users)},
+        fields=["name", "full_name"],
+        ignore_permissions=True,
+    )
+    return {u.name: u.full_name for u in rows}
 
 
 def _map_ref_doctype(dt: Optional[str]) -> Optional[str]:
@@ -54,45 +115,56 @@ def _map_route(dt: Optional[str]) -> Optional[str]:
 
 
 
-def _nlog_to_portal_dict(row: Dict[str, Any], seen_col: Optional[str]) -> Dict[str, Any]:
-    ref_dt = row.get("document_type")
-    ref_name = row.get("document_name")
+_NLOG_FIELDS = operator.itemgetter(
+    "name",
+    "creation",
+    "subject",
+    "type",
+    "document_type",
+    "document_name",
+    "for_user",
+    "owner",
+)
 
-    reference_doctype = _map_ref_doctype(ref_dt)
-    route_name = _map_route(ref_dt)
 
-    to_user = row.get("for_user") or row.get("owner")
+def _nlog_to_portal_dict(
+    row: Dict[str, Any],
+    seen_col: Optional[str],
+    name_map: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, Any]:
+    """name_map: owner -> full_name من _full_names (لو مش موجود بنجيبه من الداتابيز)."""
+    # بنسحب كل الحقول مرة واحدة في locals بدل row.get متكررة (بيتنادى لكل صف)
+    name, creation, subject, ntype, ref_dt, ref_name, for_user, owner = _NLOG_FIELDS(row)
+
+    if name_map is None:
+        name_map = _full_names([owner])
 
     is_read = _bool_seen(row, seen_col)
+    is_reminder = _is_reminder(ntype, subject)
 
     return {
-        "id": row.get("name"),  # id عام
-        "name": row.get("name"),
-        "creation": row.get("creation"),
+        "id": name,  # id عام
+        "name": name,
+        "creation": creation,
         "from_user": {
-            "name": row.get("owner"),
-            "full_name": frappe.get_value("User", row.get("owner"), "full_name"),
+            "name": owner,
+            "full_name": name_map.get(owner),
         },
-        "type": "reminder" if _looks_like_reminder(row) else (row.get("type") or "system"),
-        
-
-        "to_user": to_user,
+        "type": "reminder" if is_reminder else (ntype or "system"),
+        "to_user": for_user or owner,
         "read": is_read,
         "unread": not is_read,
-        "hash": "#reminder" if _looks_like_reminder(row) else "",
+        "hash": "#reminder" if is_reminder else "",
         "notification_text": _text_from_nlog(row),
         "notification_type_doctype": ref_dt,
         "notification_type_doc": ref_name,
-        "reference_doctype": reference_doctype,  # 'lead' | 'deal' | None
+        "reference_doctype": _map_ref_doctype(ref_dt),  # 'lead' | 'deal' | None
         "reference_name": ref_name,
-        "route_name": route_name,                # 'Lead' | 'Deal' | None
+        "route_name": _map_route(ref_dt),               # 'Lead' | 'Deal' | None
         "source": "Notification Log",
     }
 
 
-
-
-
 def get_hash(n):
     _hash = ""
     if n.type == "Mention" and n.notification_type_doc:
@@ -101,38 +173,56 @@ def get_hash(n):
         _hash = "#whatsapp"
     if n.type == "Assignment" and n.notification_type_doctype == "CRM Task":
         _hash = "#tasks"
-        if "has been removed by" in getattr(n, "message", ""):
+        if _REMOVED_RE.search(getattr(n, "message", None) or ""):
             _hash = ""
     return _hash
 
 
 # ----------------------- Unseen Count -----------------------
 
+UNSEEN_COUNT_TTL = 300  # ثواني
+
+
+def _unseen_cache_key(user: str) -> str:
+    return f"crm:unseen:{user}"
+
+
+def clear_unseen_count_cache(user: str):
+    """
+    يمسح العدد المحفوظ في Redis بعد أي تغيير في إشعارات المستخدم.
+    المسح بيحصل بعد الـ commit: لو اتمسح قبله، أي قارئ في النص هيحسب العدد
+    القديم ويحفظه لمدة UNSEEN_COUNT_TTL.
+    """
+    frappe.db.after_commit.add(
+        functools.partial(frappe.cache().delete_value, _unseen_cache_key(user))
+    )
+
+
 def _get_unseen_count_for(user: str) -> int:
+    """العدد من Redis لو موجود، وإلا بيتحسب ويتحفظ لمدة UNSEEN_COUNT_TTL."""
+    key = _unseen_cache_key(user)
+    cached = frappe.cache().get_value(key)
+    if cached is not None:
+        return int(cached)
+
+    total = _compute_unseen_count_for(user)
+    frappe.cache().set_value(key, total, expires_in_sec=UNSEEN_COUNT_TTL)
+    return total
+
+
+def _compute_unseen_count_for(user: str) -> int:
     """يحسب إجمالي غير المقروء للمستخدم من Notification Log + CRM Notification (لو موجودة)."""
     total = 0
 
-    # Notification Log
+    # Notification Log (العدّ بيتم في الداتابيز بدل ما نجيب الصفوف ونعدّها)
     seen_col = _seen_column_name()
-    fields = ["name"]
+    filters = {"for_user": user}
     if seen_col:
-        fields.append(seen_col)
-
-    rows = frappe.get_all(
-        "Notification Log",
-        filters={"for_user": user},
-        fields=fields,
-        order_by="creation desc",
-        limit_page_length=500,
-        ignore_permissions=True,
-        as_list=False,
-    )
-    for r in rows:
-        if not _bool_seen(r, seen_col):
-            total += 1
+        filters[seen_col] = 0
+    total += frappe.db.count("Notification Log", filters)
 
     # CRM Notification (legacy)
-    if frappe.db.table_exists("CRM Notification"):
+    if _has_crm_notification_table():
         total += frappe.db.count("CRM Notification", {"to_user": user, "read": 0})
 
     return total
@@ -151,16 +241,43 @@ def get_unread_count() -> int:
 
 # ----------------------- Realtime helpers -----------------------
 
+def _notify_count_changed(user: str):
+    """بعد أي تعديل: يمسح العدد المحفوظ ويذيع العدد الجديد في الخلفية."""
+    clear_unseen_count_cache(user)
+    # حساب العدد والبث في short queue بعد الـ commit عشان الـ endpoint يرجع على طول.
+    # من غير deduplicate: Frappe بيتجاهل الـ job الجديدة لو القديمة لسه شغالة، فآخر
+    # تعديل ممكن ما يتبثّش
+    frappe.enqueue(
+        "crm.api.notifications._broadcast_count",
+        queue="short",
+        user=user,
+        enqueue_after_commit=True,
+    )
+
+
 def _broadcast_count(user: str):
     """يذيع العدد الحالي للمستخدم."""
+    # بنحسب من الداتابيز مباشرة (مش من الـ cache اللي ممكن يكون قديم) ونكتب القيمة الجديدة
+    total = _compute_unseen_count_for(user)
+    frappe.cache().set_value(_unseen_cache_key(user), total, expires_in_sec=UNSEEN_COUNT_TTL)
     frappe.publish_realtime(
         event="crm_portal_notification",
-        message={"type": "count", "unseen": _get_unseen_count_for(user)},
+        message={"type": "count", "unseen": total},
         user=user,
         after_commit=True,
     )
 
 
+def _mark_nlog_seen(name: str):
+    """UPDATE مباشر لعمود seen/read بدل get_doc + save (مفيش hooks محتاجينها هنا)."""
+    seen_col = _seen_column_name()
+    if not seen_col:
+        # مفيش عمود نحفظ فيه حالة القراءة، فالـ save القديم ماكانش بيغيّر حاجة
+        return
+    Log = frappe.qb.DocType("Notification Log")
+    frappe.qb.update(Log).set(Log[seen_col], 1).where(Log.name == name).run()
+
+
 # ----------------------- New Portal Endpoints -----------------------
 
 @frappe.whitelist()
@@ -177,50 +294,68 @@ def list_portal_notifications(
     """
     user = frappe.session.user
     seen_col = _seen_column_name()
+    limit = cint(limit)
 
-    fields = [
-        "name",
-        "subject",
-        "email_content",
-        "creation",
-        "type",
-        "document_type",
-        "document_name",
-        "for_user",
-        "owner",
-    ]
-    if _has("from_user"):
-        fields.append("from_user")
-    if seen_col:
-        fields.append(seen_col)
-
-    filters = {}
+    # نفس الأعمدة في الفرعين عشان UNION ALL؛ اللي مش موجود في مصدر بيبقى NULL
+    nlog_read = f"`{seen_col}`" if seen_col else "0"
+    conditions = ""
     if before:
-        filters["creation"] = ["<", before]
+        conditions += " AND creation < %(before)s"
 
+    nlog_conditions = conditions
     if unread_only and seen_col:
-        filters[seen_col] = 0
+        nlog_conditions += f" AND `{seen_col}` = 0"
+
+    branches = [
+        f"""(
+            SELECT name, creation, 'Notification Log' AS source, type,
+                owner, for_user, subject, email_content,
+                document_type, document_name, {nlog_read} AS `read`,
+                NULL AS from_user, NULL AS to_user, NULL AS message,
+                NULL AS notification_text, NULL AS notification_type_doctype,
+                NULL AS notification_type_doc, NULL AS reference_doctype,
+                NULL AS reference_name
+            FROM `tabNotification Log`
+            WHERE for_user = %(user)s{nlog_conditions}
+            ORDER BY creation DESC
+            LIMIT %(limit)s
+        )"""
+    ]
 
-    filters["for_user"] = user
+    if include_legacy and _has_crm_notification_table():
+        crm_conditions = conditions
+        if unread_only:
+            crm_conditions += " AND `read` = 0"
+        branches.append(
+            f"""(
+            SELECT name, creation, 'CRM Notification' AS source, type,
+                NULL AS owner, NULL AS for_user, NULL AS subject, NULL AS email_content,
+                NULL AS document_type, NULL AS document_name, `read`,
+                from_user, to_user, message,
+                notification_text, notification_type_doctype,
+                notification_type_doc, reference_doctype,
+                reference_name
+            FROM `tabCRM Notification`
+            WHERE to_user = %(user)s{crm_conditions}
+            ORDER BY creation DESC
+            LIMIT %(limit)s
+        )"""
+        )
 
-    base_rows = frappe.get_all(
-        "Notification Log",
-        filters=filters,
-        fields=fields,
-        order_by="creation desc",
-        limit_page_length=max(limit, 200),
-        ignore_permissions=True,
-        as_list=False,
+    # كل فرع بياخد أحدث limit من الـ index، والـ UNION يدمجهم ويقص في الداتابيز
+    rows = frappe.db.sql(
+        " UNION ALL ".join(branches) + " ORDER BY creation DESC LIMIT %(limit)s",
+        {"user": user, "before": before, "limit": limit},
+        as_dict=True,
     )
 
-    out: List[Dict[str, Any]] = [_nlog_to_portal_dict(r, seen_col) for r in base_rows]
-
-    if include_legacy:
-        legacy = _list_crm_notifications(limit=max(limit, 200))
-        out.extend(legacy)
-
-    out.sort(key=lambda x: x.get("creation") or frappe.utils.now_datetime(), reverse=True)
-    return out[:limit]
+    name_map = _full_names(r.owner or r.from_user for r in rows)
+    return [
+        _crm_to_portal_dict(r, name_map.get(r.from_user))
+        if r.source == "CRM Notification"
+        else _nlog_to_portal_dict(r, "read" if seen_col else None, name_map)
+        for r in rows
+    ]
 
 
 @frappe.whitelist()
@@ -232,26 +367,65 @@ def mark_portal_seen(name: str, source: str = "Notification Log"):
     user = frappe.session.user
 
     if source == "Notification Log":
-        seen_col = _seen_column_name()
-        if seen_col:
-            frappe.db.set_value("Notification Log", name, seen_col, 1)
-        else:
-            doc = frappe.get_doc("Notification Log", name)
-            setattr(doc, "seen", 1)
-            doc.save(ignore_permissions=True)
-        _broadcast_count(user)
+        _mark_nlog_seen(name)
+        _notify_count_changed(user)
         return {"ok": True}
 
     if source == "CRM Notification":
         d = frappe.get_doc("CRM Notification", name)
         d.read = True
         d.save(ignore_permissions=True)
-        _broadcast_count(user)
+        _notify_count_changed(user)
         return {"ok": True}
 
     frappe.throw(f"Unknown source: {source}")
 
 
+@frappe.whitelist()
+def mark_portal_seen_bulk(names, source: str = "Notification Log"):
+    """
+    نفس mark_portal_seen لكن لمجموعة إشعارات في UPDATE واحد + بثّ العدّاد مرة واحدة.
+    names: list أو JSON string (من الـ frontend).
+    """
+    if isinstance(names, str):
+        names = frappe.parse_json(names)
+    names = list({n for n in (names or []) if n})
+    if not names:
+        frappe.throw("Notification names are required")
+
+    user = frappe.session.user
+
+    if source == "Notification Log":
+        seen_col = _seen_column_name()
+        if not seen_col:
+            frappe.throw("No 'seen' or 'read' column defined on Notification Log")
+        Log = frappe.qb.DocType("Notification Log")
+        (
+            frappe.qb.update(Log)
+            .set(Log[seen_col], 1)
+            .where(Log.name.isin(names))
+            .where(Log.for_user == user)
+        ).run()
+
+    elif source == "CRM Notification":
+        Notification = frappe.qb.DocType("CRM Notification")
+        (
+            frappe.qb.update(Notification)
+            .set(Notification.read, 1)
+            .set(Notification.modified, now())
+            .set(Notification.modified_by, user)
+            .where(Notification.name.isin(names))
+            .where(Notification.to_user == user)
+        ).run()
+        frappe.publish_realtime("crm_notification", user=user)
+
+    else:
+        frappe.throw(f"Unknown source: {source}")
+
+    _notify_count_changed(user)
+    return {"ok": True, "count": len(names)}
+
+
 
 @frappe.whitelist()
 def mark_all_portal_seen(source: str = "Notification Log"):
@@ -277,7 +451,7 @@ def mark_all_portal_seen(source: str = "Notification Log"):
             frappe.db.set_value("Notification Log", name, seen_col, 1)
         updated += len(names)
 
-    elif source == "CRM Notification" and frappe.db.table_exists("CRM Notification"):
+    elif source == "CRM Notification" and _has_crm_notification_table():
         names = frappe.get_all(
             "CRM Notification",
             filters={"to_user": user, "read": 0},
@@ -288,7 +462,7 @@ def mark_all_portal_seen(source: str = "Notification Log"):
             frappe.db.set_value("CRM Notification", name, "read", 1)
         updated += len(names)
 
-    _broadcast_count(user)
+    _notify_count_changed(user)
     return {"ok": True, "updated": updated}
 
 
@@ -345,64 +519,74 @@ def mark_seen(name: str):
     if not name:
         frappe.throw("Notification name is required")
 
-    seen_col = _seen_column_name()
-    if seen_col:
-        frappe.db.set_value("Notification Log", name, seen_col, 1)
-    else:
-        doc = frappe.get_doc("Notification Log", name)
-        setattr(doc, "seen", 1)
-        doc.save(ignore_permissions=True)
-
-    _broadcast_count(frappe.session.user)
+    _mark_nlog_seen(name)
+    _notify_count_changed(frappe.session.user)
     return {"ok": True}
 
 
 
 
 def _list_crm_notifications(limit: int = 50) -> List[Dict[str, Any]]:
-    if not frappe.db.table_exists("CRM Notification"):
+    if not _has_crm_notification_table():
         return []
 
     Notification = frappe.qb.DocType("CRM Notification")
+    User = frappe.qb.DocType("User")
     query = (
         frappe.qb.from_(Notification)
-        .select("*")
+        .left_join(User)
+        .on(User.name == Notification.from_user)
+        .select(
+            Notification.name,
+            Notification.creation,
+            Notification.from_user,
+            Notification.to_user,
+            Notification.type,
+            Notification.read,
+            Notification.message,
+            Notification.notification_text,
+            Notification.notification_type_doctype,
+            Notification.notification_type_doc,
+            Notification.reference_doctype,
+            Notification.reference_name,
+            User.full_name.as_("from_user_full_name"),
+        )
         .where(Notification.to_user == frappe.session.user)
-        .orderby("creation", order=Order.desc)
+        .orderby(Notification.creation, order=Order.desc)
+        .limit(cint(limit))
     )
     notifications = query.run(as_dict=True)
 
-    out = []
-    for n in notifications[:limit]:
-        is_read = bool(n.read)
-        out.append(
-            {
-                "id": n.name,
-                "name": n.name,
-                "creation": n.creation,
-                "from_user": {
-                    "name": n.from_user,
-                    "full_name": frappe.get_value("User", n.from_user, "full_name"),
-                },
-                "type": n.type,
-                "to_user": n.to_user,
-                "read": is_read,
-                "unread": not is_read,
-                "hash": get_hash(n),
-                "notification_text": n.notification_text,
-                "notification_type_doctype": n.notification_type_doctype,
-                "notification_type_doc": n.notification_type_doc,
-                "reference_doctype": (
-                    "deal" if n.reference_doctype == "CRM Deal" else "lead"
-                ),
-                "reference_name": n.reference_name,
-                "route_name": (
-                    "Deal" if n.reference_doctype == "CRM Deal" else "Lead"
-                ),
-                "source": "CRM Notification",
-            }
-        )
-    return out
+    return [_crm_to_portal_dict(n, n.from_user_full_name) for n in notifications]
+
+
+def _crm_to_portal_dict(n, from_user_full_name: Optional[str]) -> Dict[str, Any]:
+    is_read = bool(n.read)
+    return {
+        "id": n.name,
+        "name": n.name,
+        "creation": n.creation,
+        "from_user": {
+            "name": n.from_user,
+            "full_name": from_user_full_name,
+        },
+        "type": n.type,
+        "to_user": n.to_user,
+        "read": is_read,
+        "unread": not is_read,
+        "hash": get_hash(n),
+        "notification_text": n.notification_text,
+        "notification_type_doctype": n.notification_type_doctype,
+        "notification_type_doc": n.notification_type_doc,
+        "reference_doctype": (
+            "deal" if n.reference_doctype == "CRM Deal" else "lead"
+        ),
+        "reference_name": n.reference_name,
+        "route_name": (
+            "Deal" if n.reference_doctype == "CRM Deal" else "Lead"
+        ),
+        "source": "CRM Notification",
+    }
 
 
 @frappe.whitelist()
@@ -415,15 +599,27 @@ def get_notifications():
 def mark_as_read(user=None, doc=None):
     """تعليم إشعارات CRM Notification كمقروء (تاريخيًا) + بثّ realtime."""
     user = user or frappe.session.user
-    filters = {"to_user": user, "read": False}
-    or_filters = []
+    Notification = frappe.qb.DocType("CRM Notification")
+    condition = (Notification.to_user == user) & (Notification.read == 0)
     if doc:
-        or_filters = [{"comment": doc}, {"notification_type_doc": doc}]
-    for k in frappe.get_all("CRM Notification", filters=filters, or_filters=or_filters):
-        d = frappe.get_doc("CRM Notification", k.name)
-        d.read = True
-        d.save(ignore_permissions=True)
-    _broadcast_count(user)
+        condition &= (Notification.comment == doc) | (Notification.notification_type_doc == doc)
+
+    # مفيش حاجة غير مقروءة: مفيش UPDATE ولا بثّ
+    if not frappe.qb.from_(Notification).select(Notification.name).where(condition).limit(1).run():
+        return True
+
+    # UPDATE واحد بدل get_doc/save لكل صف
+    (
+        frappe.qb.update(Notification)
+        .set(Notification.read, 1)
+        .set(Notification.modified, now())
+        .set(Notification.modified_by, frappe.session.user)
+        .where(condition)
+    ).run()
+
+    # نفس الحدث اللي كان on_update بيبعته لكل صف، مرة واحدة بس
+    frappe.publish_realtime("crm_notification", user=user)
+    _notify_count_changed(user)
     return True
 
 
@@ -437,7 +633,7 @@ def broadcast_log_realtime(doc, method=None):
     target_user = getattr(doc, "for_user", None) or getattr(doc, "owner", None)
     if not target_user:
         return
-    _broadcast_count(target_user)
+    _notify_count_changed(target_user)
 
 
 
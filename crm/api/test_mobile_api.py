@@ -16,6 +16,7 @@ import frappe
 from frappe.tests.utils import FrappeTestCase
 from frappe.utils import today, add_days, now_datetime
 from datetime import datetime, timedelta
+from unittest.mock import patch
 import json
 
 
@@ -329,6 +330,66 @@ class TestMobileAPI(FrappeTestCase):
 		self.assertIsInstance(data["late"], list)
 		self.assertIsInstance(data["upcoming"], list)
 	
+	def test_get_task(self):
+		"""Test getting a single task with detail fields"""
+		from crm.api.mobile_api import create_task, get_task
+		
+		create_result = create_task(
+			task_type="Test Task Type",
+			title="Detail Task",
+			description="Task description for the detail screen"
+		)
+		task_name = create_result["name"]
+		self.created_tasks.append(task_name)
+		
+		task = get_task(task_id=task_name)
+		
+		self.assertEqual(task.get("name"), task_name)
+		self.assertEqual(task.get("title"), "Detail Task")
+		self.assertEqual(task.get("description"), "Task description for the detail screen")
+		self.assertIsInstance(task.get("assigned_to"), list)
+
+	def test_filter_tasks_cursor_total(self):
+		"""Test that total stays the same when paging with a cursor"""
+		from crm.api.mobile_api import create_task, filter_tasks
+
+		for i in range(3):
+			create_result = create_task(
+				task_type="Test Task Type",
+				title=f"Cursor Task {i+1}"
+			)
+			self.created_tasks.append(create_result["name"])
+
+		first = filter_tasks(limit=1)["message"]
+		self.assertTrue(first["has_next"])
+		self.assertIsNotNone(first["next_cursor"])
+
+		second = filter_tasks(limit=1, cursor=first["next_cursor"])["message"]
+		self.assertEqual(second["total"], first["total"])
+		self.assertNotEqual(second["data"][0]["name"], first["data"][0]["name"])
+
+	def test_get_assigned_users_bulk(self):
+		"""Test bulk assignee prefetch matches per-task lookup"""
+		from crm.api.mobile_api import create_task, _get_assigned_users, _get_assigned_users_bulk
+		
+		task_names = []
+		for i in range(2):
+			create_result = create_task(
+				task_type="Test Task Type",
+				title=f"Bulk Assign Task {i+1}",
+				assigned_to_list=["Administrator"]
+			)
+			task_name = create_result["name"]
+			self.created_tasks.append(task_name)
+			task_names.append(task_name)
+		
+		assigned_map = _get_assigned_users_bulk("CRM Task", task_names)
+		
+		self.assertEqual(set(assigned_map.keys()), set(task_names))
+		for task_name in task_names:
+			self.assertEqual(assigned_map[task_name], _get_assigned_users("CRM Task", task_name))
+		self.assertEqual(_get_assigned_users_bulk("CRM Task", []), {})
+	
 	# ============================================================================
 	# LEAD API TESTS
 	# ============================================================================
@@ -540,6 +601,23 @@ class TestMobileAPI(FrappeTestCase):
 		self.assertIn("client_id", config)
 		self.assertIn("base_url", config)
 	
+	def test_validate_host(self):
+		"""Test Host validation against the site's configured domains"""
+		from crm.api.mobile_api import _validate_host
+		
+		class MockRequest:
+			def __init__(self, host):
+				self.headers = {"Host": host}
+		
+		site_name = frappe.local.site
+		
+		with patch.object(frappe.local, "request", MockRequest("facebook.com"), create=True):
+			self.assertRaises(frappe.ValidationError, _validate_host)
+		
+		with patch.dict(frappe.local.conf, {"domains": [site_name], "host_name": None}):
+			with patch.object(frappe.local, "request", MockRequest(f"{site_name}:8000"), create=True):
+				self.assertEqual(_validate_host(), site_name.lower())
+	
 	def test_get_app_logo(self):
 		"""Test getting app logo from Website Settings"""
 		from crm.api.mobile_api import get_app_logo
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.utils import now_datetime, add_to_date
+from frappe.tests.utils import FrappeTestCase
+
+from crm.api.notifications import list_portal_notifications, mark_portal_seen_bulk
+
+
+class TestPortalNotifications(FrappeTestCase):
+    def setUp(self):
+        self.addCleanup(self._restore_user)
+        self.original_user = frappe.session.user
+        self.created_docs: list[frappe.model.document.Document] = []
+
+        # realtime / push / counter jobs مش محتاجينها في الاختبارات
+        for target in (
+            "crm.api.notifications.broadcast_log_realtime",
+            "crm.api.firebase.send_push_for_notification_log",
+            "crm.api.notifications._notify_count_changed",
+        ):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user_a = self._ensure_user("portal.notify.a@example.com")
+        self.user_b = self._ensure_user("portal.notify.b@example.com")
+
+        # إشعارات user_a من المصدرين متداخلة في الوقت (الأحدث أولاً):
+        # nlog_1, crm_1, nlog_2, crm_2, nlog_3
+        self.nlog_1 = self._add_nlog(self.user_a, minutes_ago=1)
+        self.crm_1 = self._add_crm(self.user_a, minutes_ago=2)
+        self.nlog_2 = self._add_nlog(self.user_a, minutes_ago=3)
+        self.crm_2 = self._add_crm(self.user_a, minutes_ago=4)
+        self.nlog_3 = self._add_nlog(self.user_a, minutes_ago=5)
+
+        # إشعارات user_b
+        self.other_nlog = self._add_nlog(self.user_b, minutes_ago=1)
+        self.other_crm = self._add_crm(self.user_b, minutes_ago=1)
+
+    def tearDown(self):
+        frappe.set_user(self.original_user)
+        for doc in reversed(self.created_docs):
+            if doc and doc.name and frappe.db.exists(doc.doctype, doc.name):
+                doc.delete(ignore_permissions=True)
+
+    def _restore_user(self):
+        frappe.set_user(self.original_user)
+
+    def _ensure_user(self, email: str) -> str:
+        if frappe.db.exists("User", email):
+            return email
+        user = frappe.get_doc(
+            {
+                "doctype": "User",
+                "email": email,
+                "first_name": email.split("@")[0],
+                "enabled": 1,
+                "send_welcome_email": 0,
+                "roles": [{"role": "System Manager"}],
+            }
+        ).insert(ignore_permissions=True)
+        self.created_docs.append(user)
+        return user.name
+
+    def _set_creation(self, doc, minutes_ago: int):
+        frappe.db.set_value(
+            doc.doctype,
+            doc.name,
+            "creation",
+            add_to_date(now_datetime(), minutes=-minutes_ago),
+            update_modified=False,
+        )
+        doc.reload()
+
+    def _add_nlog(self, user: str, *, minutes_ago: int) -> str:
+        doc = frappe.get_doc(
+            {
+                "doctype": "Notification Log",
+                "for_user": user,
+                "type": "Alert",
+                "subject": f"Portal test {minutes_ago}",
+            }
+        ).insert(ignore_permissions=True)
+        self.created_docs.append(doc)
+        self._set_creation(doc, minutes_ago)
+        return doc.name
+
+    def _add_crm(self, user: str, *, minutes_ago: int) -> str:
+        doc = frappe.get_doc(
+            {
+                "doctype": "CRM Notification",
+                "to_user": user,
+                "type": "Mention",
+                "notification_text": f"Portal test {minutes_ago}",
+            }
+        ).insert(ignore_permissions=True)
+        self.created_docs.append(doc)
+        self._set_creation(doc, minutes_ago)
+        return doc.name
+
+    def _is_read(self, doctype: str, name: str) -> bool:
+        return bool(frappe.db.get_value(doctype, name, "read"))
+
+    def _names(self, rows):
+        return [r["name"] for r in rows]
+
+    # ----------------------------------------------------------------
+    # mark_portal_seen_bulk
+    # ----------------------------------------------------------------
+    def test_mark_bulk_notification_log_only_marks_own_rows(self):
+        frappe.set_user(self.user_a)
+        result = mark_portal_seen_bulk([self.nlog_1, self.nlog_2, self.other_nlog])
+
+        self.assertTrue(result["ok"])
+        self.assertTrue(self._is_read("Notification Log", self.nlog_1))
+        self.assertTrue(self._is_read("Notification Log", self.nlog_2))
+        self.assertFalse(self._is_read("Notification Log", self.nlog_3))
+        self.assertFalse(self._is_read("Notification Log", self.other_nlog))
+
+    def test_mark_bulk_crm_notification_only_marks_own_rows(self):
+        frappe.set_user(self.user_a)
+        mark_portal_seen_bulk([self.crm_1, self.other_crm], source="CRM Notification")
+
+        self.assertTrue(self._is_read("CRM Notification", self.crm_1))
+        self.assertFalse(self._is_read("CRM Notification", self.crm_2))
+        self.assertFalse(self._is_read("CRM Notification", self.other_crm))
+
+    def test_mark_bulk_accepts_json_string(self):
+        frappe.set_user(self.user_a)
+        result = mark_portal_seen_bulk(json.dumps([self.nlog_1, self.nlog_1, self.nlog_3]))
+
+        self.assertEqual(result["count"], 2)
+        self.assertTrue(self._is_read("Notification Log", self.nlog_1))
+        self.assertTrue(self._is_read("Notification Log", self.nlog_3))
+        self.assertFalse(self._is_read("Notification Log", self.nlog_2))
+
+    def test_mark_bulk_rejects_unknown_source(self):
+        frappe.set_user(self.user_a)
+        with self.assertRaises(frappe.ValidationError):
+            mark_portal_seen_bulk([self.nlog_1], source="Email")
+        self.assertFalse(self._is_read("Notification Log", self.nlog_1))
+
+    def test_mark_bulk_requires_names(self):
+        frappe.set_user(self.user_a)
+        with self.assertRaises(frappe.ValidationError):
+            mark_portal_seen_bulk("[]")
+
+    # ----------------------------------------------------------------
+    # list_portal_notifications
+    # ----------------------------------------------------------------
+    def test_list_merges_sources_newest_first(self):
+        frappe.set_user(self.user_a)
+        rows = list_portal_notifications(limit=20)
+
+        self.assertEqual(
+            self._names(rows),
+            [self.nlog_1, self.crm_1, self.nlog_2, self.crm_2, self.nlog_3],
+        )
+        self.assertEqual(
+            [r["source"] for r in rows],
+            [
+                "Notification Log",
+                "CRM Notification",
+                "Notification Log",
+                "CRM Notification",
+                "Notification Log",
+            ],
+        )
+
+    def test_list_applies_limit_across_sources(self):
+        frappe.set_user(self.user_a)
+        rows = list_portal_notifications(limit=3)
+
+        self.assertEqual(self._names(rows), [self.nlog_1, self.crm_1, self.nlog_2])
+
+    def test_list_before_pages_both_sources(self):
+        frappe.set_user(self.user_a)
+        first_page = list_portal_notifications(limit=2)
+        next_page = list_portal_notifications(limit=2, before=first_page[-1]["creation"])
+
+        self.assertEqual(self._names(first_page), [self.nlog_1, self.crm_1])
+        self.assertEqual(self._names(next_page), [self.nlog_2, self.crm_2])
+
+    def test_list_unread_only_filters_both_sources(self):
+        frappe.set_user(self.user_a)
+        mark_portal_seen_bulk([self.nlog_2])
+        mark_portal_seen_bulk([self.crm_1], source="CRM Notification")
+
+        rows = list_portal_notifications(limit=20, unread_only=1)
+
+        self.assertEqual(self._names(rows), [self.nlog_1, self.crm_2, self.nlog_3])
+        self.assertTrue(all(r["unread"] for r in rows))
+
+    def test_list_without_legacy_skips_crm_notification(self):
+        frappe.set_user(self.user_a)
+        rows = list_portal_notifications(limit=20, include_legacy=0)
+
+        self.assertEqual(self._names(rows), [self.nlog_1, self.nlog_2, self.nlog_3])
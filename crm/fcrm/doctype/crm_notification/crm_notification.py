@@ -9,6 +9,9 @@ from frappe.model.document import Document
 class CRMNotification(Document):
 	def on_update(self):
 		if self.to_user:
+			from crm.api.notifications import clear_unseen_count_cache
+
+			clear_unseen_count_cache(self.to_user)
 			frappe.publish_realtime("crm_notification", user= self.to_user)
 
 def notify_user(args):
@@ -35,3 +38,8 @@ def notify_user(args):
 	if frappe.db.exists("CRM Notification", values):
 		return
 	frappe.get_doc(values).insert(ignore_permissions=True)
+
+
+def on_doctype_update():
+	# list_portal_notifications / get_notifications read a user's newest rows
+	frappe.db.add_index("CRM Notification", ["to_user", "creation"])
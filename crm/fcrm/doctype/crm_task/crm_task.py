@@ -179,3 +179,12 @@ class CRMTask(Document):
 				pass
 		
 		return data
+
+
+def on_doctype_update():
+	# Composite indexes for the mobile task list endpoints (filter_tasks,
+	# home_tasks, main_page_buckets), which filter and sort by start_date,
+	# status, priority and modified. Runs on install and every migrate.
+	frappe.db.add_index("CRM Task", ["start_date", "status"])
+	frappe.db.add_index("CRM Task", ["start_date", "priority", "modified"])
+	frappe.db.add_index("CRM Task", ["modified", "name"])
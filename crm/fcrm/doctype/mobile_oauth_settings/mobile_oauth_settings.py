@@ -7,5 +7,9 @@ from frappe.model.document import Document
 
 class MobileOAuthSettings(Document):
 	"""Single DocType to store mobile OAuth configuration per site."""
-	pass
+
+	def on_update(self):
+		from crm.api.mobile_api import clear_oauth_config_cache
+
+		clear_oauth_config_cache()
 
@@ -5,21 +5,8 @@ from typing import List, Set
 import frappe
 from frappe import _
 
-
-# ---- reuse the same heuristics you used in lead.py ----
-def _member_user_col() -> tuple[str, str]:
-    """Return (child_doctype_name, user_link_fieldname). Defaults to ('Member','user')."""
-    try:
-        meta = frappe.get_meta("Member", cached=True)
-        for f in meta.get("fields", []):
-            if getattr(f, "fieldtype", None) == "Link" and getattr(f, "options", None) == "User":
-                return "Member", f.fieldname
-        for alt in ("user", "member", "user_id", "user_email", "allocated_to"):
-            if meta.get_field(alt):
-                return "Member", alt
-    except Exception:
-        pass
-    return "Member", "user"
+# ---- reuse the same heuristics used in leads_permissions.py ----
+from crm.fcrm.permissions.leads_permissions import _member_user_col, _roles_cached
 
 
 # -----------------------------
@@ -27,11 +14,8 @@ def _member_user_col() -> tuple[str, str]:
 # -----------------------------
 def _has_role(role: str, user: str | None = None) -> bool:
     user = user or frappe.session.user
-    try:
-        return bool(frappe.has_role(role, user=user))
-    except TypeError:
-        # fallback for older signatures
-        return role in (frappe.get_roles(user) or [])
+    # roles are memoized per request, so repeated checks don't hit the DB
+    return role in _roles_cached(user)
 
 
 def _is_privileged(user: str | None = None) -> bool:
@@ -72,7 +56,16 @@ def _is_team_member(user: str | None = None) -> bool:
 
 
 def _team_members_of(team_leader: str) -> Set[str]:
-    """Return set of Users that belong to the Team led by team_leader."""
+    """Return set of Users that belong to the Team led by team_leader (cached per request)."""
+    cache = getattr(frappe.local, "_team_members_cache", None)
+    if cache is None:
+        cache = frappe.local._team_members_cache = {}
+    if team_leader not in cache:
+        cache[team_leader] = _fetch_team_members(team_leader)
+    return cache[team_leader]
+
+
+def _fetch_team_members(team_leader: str) -> Set[str]:
     team = frappe.db.get_value("Team", {"team_leader": team_leader}, "name")
     if not team:
         return set()
@@ -118,7 +111,8 @@ def assign_lead(
     We keep minimal safety: actor must have READ access to the document.
     If you want to remove even that, tell me.
     """
-    users = [u for u in (users or []) if u]
+    # drop blanks and duplicates, keeping the caller's order
+    users = list(dict.fromkeys(u for u in (users or []) if u))
     actor = frappe.session.user
 
     if not doctype or not name:
@@ -133,14 +127,14 @@ def assign_lead(
 
     from frappe.desk.form.assign_to import add as add_assignment
 
-    for u in users:
-        add_assignment({
-            "doctype": doctype,
-            "name": name,
-            "assign_to": [u],
-            "description": description or "",
-            "notify": 1,
-        })
+    # add() accepts the whole list, so assign everyone in one call
+    add_assignment({
+        "doctype": doctype,
+        "name": name,
+        "assign_to": users,
+        "description": description or "",
+        "notify": 1,
+    })
 
     frappe.logger().info(f"[OPEN] {actor} assigned {doctype} {name} to {users}")
     return {"ok": True, "assigned_to": users}
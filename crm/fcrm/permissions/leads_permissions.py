@@ -1,23 +1,101 @@
 from __future__ import annotations
 from typing import Optional, Tuple, List
-import json
 import frappe
+try:
+    # orjson أسرع بكتير في الـ parse (موجود مع Frappe v15)
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # --------------------------------------------------------------------
 # Helpers
 # --------------------------------------------------------------------
+def _roles_cached(user: str) -> set:
+    """أدوار المستخدم مرة واحدة لكل request (has_permission بيتنادى لكل صف في الـ list)."""
+    cache = getattr(frappe.local, "_role_cache", None)
+    if cache is None:
+        cache = frappe.local._role_cache = {}
+    if user not in cache:
+        cache[user] = set(frappe.get_roles(user))
+    return cache[user]
+
+
+# نتيجة اكتشاف عمود الـ User في Member محفوظة في Redis (مشتركة بين الـ workers)
+# وبتتمسح في after_migrate؛ بنحفظها بس لو الـ meta اتقرت بنجاح
+_MEMBER_USER_COL_CACHE_KEY = "crm:member_user_col"
+
+
 def _member_user_col() -> Tuple[str, str]:
+    cached = frappe.cache().get_value(_MEMBER_USER_COL_CACHE_KEY)
+    if cached:
+        return tuple(cached)
     try:
         meta = frappe.get_meta("Member", cached=True)
-        for f in meta.get("fields", []):
-            if getattr(f, "fieldtype", None) == "Link" and getattr(f, "options", None) == "User":
-                return "Member", f.fieldname
+    except Exception:
+        # خطأ مؤقت: الافتراضي للطلب ده بس من غير ما نحفظه
+        return "Member", "user"
+
+    result = ("Member", "user")
+    for f in meta.get("fields", []):
+        if getattr(f, "fieldtype", None) == "Link" and getattr(f, "options", None) == "User":
+            result = ("Member", f.fieldname)
+            break
+    else:
         for alt in ("user", "member", "user_id", "user_email", "allocated_to"):
             if meta.get_field(alt):
-                return "Member", alt
-    except Exception:
-        pass
-    return "Member", "user"
+                result = ("Member", alt)
+                break
+
+    frappe.cache().set_value(_MEMBER_USER_COL_CACHE_KEY, result)
+    return result
+
+
+def clear_member_user_col_cache():
+    """after_migrate: يمسح عمود الـ User المحفوظ لـ Member عشان يتكشف من جديد."""
+    frappe.cache().delete_value(_MEMBER_USER_COL_CACHE_KEY)
+
+
+def _led_members_cached(user: str) -> List[str]:
+    """أعضاء الفرق اللي المستخدم Team Leader عليها، مرة واحدة لكل request."""
+    cache = getattr(frappe.local, "_led_members_cache", None)
+    if cache is None:
+        cache = frappe.local._led_members_cache = {}
+    if user not in cache:
+        member_dt, member_col = _member_user_col()
+        cache[user] = frappe.db.sql_list(
+            f"""
+            SELECT m.`{member_col}`
+            FROM `tab{member_dt}` m
+            JOIN `tabTeam` t ON m.`parent` = t.`name`
+            WHERE t.`team_leader` = %s
+            """,
+            (user,),
+        ) or []
+    return cache[user]
+
+
+# الـ index اللي الـ subquery بتاعة get_permission_query_conditions محتاجاه
+# (بيتضاف في crm.install.add_indexes مع الـ install وكل migrate)
+TODO_ASSIGNMENT_INDEX = ["reference_type", "status", "allocated_to"]
+
+# الـ sites اللي اتأكدنا إن الـ index موجود عليها؛ بنحفظ النتيجة الإيجابية بس
+# عشان الـ worker يلاحظ الـ index لما يتضاف من غير restart
+_TODO_INDEX_SITES = set()
+
+
+def _check_todo_index(site: str) -> bool:
+    """تحذير لو الـ index ناقص (الـ list view هتعمل full scan على ToDo)."""
+    if site in _TODO_INDEX_SITES:
+        return True
+    index_name = frappe.db.get_index_name(TODO_ASSIGNMENT_INDEX)
+    if frappe.db.has_index("tabToDo", index_name):
+        _TODO_INDEX_SITES.add(site)
+        return True
+    frappe.logger().warning(
+        f"ToDo index {index_name} is missing on {site}; run bench migrate"
+    )
+    return False
+
 
 # --------------------------------------------------------------------
 # Query Conditions (List View / get_list)
@@ -33,7 +111,7 @@ def get_permission_query_conditions(user: str) -> Optional[str]:
     if not user or user == "Guest":
         return "1=0"
 
-    roles = set(frappe.get_roles(user))
+    roles = _roles_cached(user)
     
     # تحذير: لا تضف Sales Manager هنا لتجنب كشف كل البيانات
     if "System Manager" in roles:
@@ -44,32 +122,21 @@ def get_permission_query_conditions(user: str) -> Optional[str]:
     # 1. المالك (Owner)
     is_owner = f"`tabCRM Lead`.owner = {escaped_user}"
 
-    # 2. المسند إليه (Assigned To Self)
-    assigned_self = f"""EXISTS (
-        SELECT 1
+    # 2 + 3. المسند إليه أو لأحد أعضاء فريقه (لو هو Team Leader):
+    # subquery واحدة مش مرتبطة بالصف، فالـ optimizer بيحسبها مرة واحدة
+    _check_todo_index(frappe.local.site)
+    allocated = [user] + [m for m in _led_members_cached(user) if m and m != user]
+    allocated_sql = ", ".join(frappe.db.escape(u) for u in allocated)
+    assigned = f"""`tabCRM Lead`.`name` IN (
+        SELECT td.`reference_name`
         FROM `tabToDo` td
         WHERE td.`reference_type` = 'CRM Lead'
-          AND td.`reference_name` = `tabCRM Lead`.`name`
-          AND td.`allocated_to` = {escaped_user}
           AND td.`status` = 'Open'
+          AND td.`allocated_to` IN ({allocated_sql})
     )"""
 
-    # 3. الفريق (Team Leader logic)
-    member_dt, member_col = _member_user_col()
-    assigned_team = f"""EXISTS (
-        SELECT 1
-        FROM `tab{member_dt}` m
-        JOIN `tabTeam` t ON m.`parent` = t.`name`
-        JOIN `tabToDo` td
-             ON td.`reference_type` = 'CRM Lead'
-            AND td.`reference_name` = `tabCRM Lead`.`name`
-            AND td.`status` = 'Open'
-        WHERE t.`team_leader` = {escaped_user}
-          AND td.`allocated_to` = m.`{member_col}`
-    )"""
-
-    # الجمع بين الشروط: المالك OR مسند لي OR مسند لفريقي
-    return f"({is_owner} OR {assigned_self} OR {assigned_team})"
+    # الجمع بين الشروط: المالك OR مسند لي أو لفريقي
+    return f"({is_owner} OR {assigned})"
 
 
 # --------------------------------------------------------------------
@@ -85,7 +152,7 @@ def has_permission(doc, ptype: str, user: str) -> bool:
     if not user or user == "Guest":
         return False
 
-    roles = set(frappe.get_roles(user))
+    roles = _roles_cached(user)
     
     # 1. System Manager فقط له صلاحية مطلقة
     if "System Manager" in roles:
@@ -97,7 +164,7 @@ def has_permission(doc, ptype: str, user: str) -> bool:
 
     # تحضير قائمة المسند إليهم
     try:
-        assigned_list: List[str] = json.loads(doc._assign or "[]")
+        assigned_list: List[str] = json_loads(doc._assign or "[]") or []
     except Exception:
         assigned_list = []
 
@@ -105,49 +172,28 @@ def has_permission(doc, ptype: str, user: str) -> bool:
     if user in assigned_list:
         return True
 
-    # فحص الـ ToDo للتأكد (Fail-safe)
-    if frappe.db.exists("ToDo", {
-        "reference_type": doc.doctype,
-        "reference_name": doc.name,
-        "allocated_to": user,
-        "status": "Open",
-    }):
-        return True
-
     # 4. منطق Team Leader: هل Lead مسند لأي شخص في فريقي؟
-    member_dt, member_col = _member_user_col()
-    
     # جلب جميع الأعضاء الذين يرأسهم هذا المستخدم
-    members = frappe.db.sql_list(
-        f"""
-        SELECT m.`{member_col}`
-        FROM `tab{member_dt}` m
-        JOIN `tabTeam` t ON m.`parent` = t.`name`
-        WHERE t.`team_leader` = %s
-        """,
-        (user,),
-    ) or []
+    members = _led_members_cached(user)
 
     # هل أي عضو من فريقي موجود في قائمة الإسناد الحالية؟
     if any(mem and mem in assigned_list for mem in members):
         return True
 
-    # فحص أعمق في جدول ToDo للأعضاء (للحالات المعقدة)
-    if members:
-        in_tuple = tuple(x for x in members if x)
-        if in_tuple and frappe.db.sql(
-            """
-            SELECT 1
-            FROM `tabToDo`
-            WHERE `reference_type` = %(rt)s
-              AND `reference_name` = %(rn)s
-              AND `status` = 'Open'
-              AND `allocated_to` IN %(members)s
-            LIMIT 1
-            """,
-            {"rt": doc.doctype, "rn": doc.name, "members": in_tuple},
-            as_dict=True,
-        ):
-            return True
+    # فحص الـ ToDo (Fail-safe) للمستخدم وأعضاء فريقه في query واحدة
+    allocated = (user,) + tuple(x for x in members if x)
+    if frappe.db.sql(
+        """
+        SELECT 1
+        FROM `tabToDo`
+        WHERE `reference_type` = %(rt)s
+          AND `reference_name` = %(rn)s
+          AND `status` = 'Open'
+          AND `allocated_to` IN %(allocated)s
+        LIMIT 1
+        """,
+        {"rt": doc.doctype, "rn": doc.name, "allocated": allocated},
+    ):
+        return True
 
-    return False
\ No newline at end of file
+    return False
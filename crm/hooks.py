@@ -261,7 +261,12 @@ ignore_links_on_delete = [
 # --------------------------------
 # auth_hooks = ["crm.auth.validate"]
 
-after_migrate = ["crm.fcrm.doctype.fcrm_settings.fcrm_settings.after_migrate"]
+after_migrate = [
+    "crm.fcrm.doctype.fcrm_settings.fcrm_settings.after_migrate",
+    "crm.install.add_indexes",
+    "crm.api.notifications.clear_schema_cache",
+    "crm.fcrm.permissions.leads_permissions.clear_member_user_col_cache",
+]
 
 # OAuth Fix - Disabled - using default Frappe behavior (infinite refresh tokens)
 # boot_session = ["crm.oauth_fix.ensure_oauth_fix_applied"]  # Disabled - using default Frappe OAuth behavior
@@ -5,8 +5,18 @@ This module contains functions that run during app installation.
 """
 
 import frappe
+from crm.fcrm.permissions.leads_permissions import TODO_ASSIGNMENT_INDEX
 from crm.setup.oauth_bootstrap import run_bootstrap
 
+# Composite indexes on core doctypes that CRM queries depend on. These doctypes
+# have no controller in this app to host on_doctype_update, so add_indexes runs
+# them from after_install and after_migrate instead of a one-off patch.
+CORE_DOCTYPE_INDEXES = [
+    ("ToDo", TODO_ASSIGNMENT_INDEX),
+    # portal notification list and unseen counter filter by for_user, newest first
+    ("Notification Log", ["for_user", "creation"]),
+]
+
 
 def before_install():
     """
@@ -27,6 +37,8 @@ def after_install():
     3. Sets refresh token expiry to 1 hour (3600 seconds)
     """
     frappe.log("Running CRM app post-install setup...")
+
+    add_indexes()
     
     # OAuth refresh token expiry setting removed - using default Frappe behavior (infinite refresh tokens)
     # try:
@@ -73,3 +85,18 @@ def after_install():
         frappe.log_error(f"Post-install setup failed: {str(e)}", "CRM Install Error")
         # Don't fail installation if OAuth setup fails
         frappe.log(f"⚠️  Post-install setup failed: {str(e)}")
+
+
+def add_indexes():
+    """
+    Add CORE_DOCTYPE_INDEXES to the site.
+    
+    Runs on install and on every migrate; add_index skips indexes that already exist.
+    """
+    for doctype, fields in CORE_DOCTYPE_INDEXES:
+        try:
+            frappe.db.add_index(doctype, fields)
+        except Exception as e:
+            # Log but don't fail install/migrate
+            frappe.log_error(f"Failed to add index {fields} on {doctype}: {str(e)}", "CRM Index Error")
+            frappe.log(f"⚠️  Failed to add index {fields} on {doctype}: {str(e)}")
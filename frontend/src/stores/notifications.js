@@ -55,12 +55,16 @@ export const notificationsStore = defineStore('crm-notifications', () => {
     const list = (notifications.data || []).filter(n => !n.read)
     if (!list.length) return
     try {
+      // طلب واحد لكل مصدر بدل طلب لكل إشعار
+      const bySource = {}
+      for (const n of list) {
+        const source = n.source || 'Notification Log'
+        if (!bySource[source]) bySource[source] = []
+        bySource[source].push(n.name)
+      }
       await Promise.all(
-        list.map(n =>
-          call('crm.api.notifications.mark_portal_seen', {
-            name: n.name,
-            source: n.source || 'Notification Log',
-          }),
+        Object.entries(bySource).map(([source, names]) =>
+          call('crm.api.notifications.mark_portal_seen_bulk', { names, source }),
         ),
       )
     } finally {